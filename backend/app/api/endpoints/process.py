@@ -1,11 +1,16 @@
 
 import os
-import glob
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+import shutil
+import asyncio
+import threading
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException
 from backend.app.core.config import settings
 from backend.app.services.storage import StorageService
+from backend.app.services.status import JobStatusStore
 from backend.app.services.preprocessing import ImagePreprocessor
 from backend.app.services.ocr import OCRService
+from backend.app.core.errors import OCRFailure, VisionFailure
 from backend.app.services.vision.stub import StubVisionProvider
 from backend.app.services.vision.prompts import FLOWCHART_PROMPT
 from backend.app.services.inference import InferenceEngine
@@ -13,56 +18,166 @@ from backend.app.services.mermaid.generator import MermaidGenerator
 from backend.app.services.mermaid.renderer import MermaidRenderer
 from loguru import logger
 
+# Resolved once at import; providers with missing SDKs are left out and
+# their import error kept, so selecting one fails loudly instead of silently
+_PROVIDER_REGISTRY = {"stub": StubVisionProvider}
+_PROVIDER_IMPORT_ERRORS = {}
+try:
+    from backend.app.services.vision.openai import OpenAIVisionProvider
+    _PROVIDER_REGISTRY["openai"] = OpenAIVisionProvider
+except ImportError as e:
+    _PROVIDER_IMPORT_ERRORS["openai"] = e
+try:
+    from backend.app.services.vision.gemini import GeminiVisionProvider
+    _PROVIDER_REGISTRY["gemini"] = GeminiVisionProvider
+except ImportError as e:
+    _PROVIDER_IMPORT_ERRORS["gemini"] = e
+
 router = APIRouter()
 
-# In-memory status store for MVP (use Redis/DB in prod)
-JOB_STATUS = {}
+# Shared across uvicorn workers when REDIS_URL is configured
+job_store = JobStatusStore()
+
+# Files written into the job dir by the pipeline itself
+GENERATED_OUTPUTS = frozenset({"diagram.mmd", "diagram.png", "diagram.svg"})
+
+# Jobs waiting for a pipeline worker
+JOB_QUEUE: asyncio.Queue = asyncio.Queue()
+_WORKERS: List[asyncio.Task] = []
+
+# Shared across all jobs so concurrency/rate limits apply process-wide
+vision_provider = None
+
+# EasyOCR reader, loaded once (see _get_ocr_service)
+_ocr_service: Optional[OCRService] = None
+_OCR_LOCK = threading.Lock()
+
+def _create_vision_provider():
+    name = settings.VISION_PROVIDER
+    if name in _PROVIDER_IMPORT_ERRORS:
+        # Configured provider is known but its dependencies are missing
+        error = _PROVIDER_IMPORT_ERRORS[name]
+        logger.error(f"Vision provider '{name}' could not be imported: {error}")
+        raise VisionFailure(f"Vision provider '{name}' is unavailable: {error}")
+    provider_cls = _PROVIDER_REGISTRY.get(name)
+    if provider_cls is None:
+        logger.warning(f"Unknown vision provider '{name}', using stub.")
+        provider_cls = StubVisionProvider
+    return provider_cls()
+
+async def process_loop():
+    """Pulls job IDs off the queue and runs them through the pipeline."""
+    while True:
+        job_id = await JOB_QUEUE.get()
+        try:
+            await run_pipeline(job_id)
+        except Exception as e:
+            # Never let one job take the worker down with it
+            logger.exception(f"Pipeline worker error on job {job_id}: {e}")
+        finally:
+            try:
+                await job_store.release(job_id)
+            except Exception as e:
+                logger.warning(f"Could not release lease for job {job_id}: {e}")
+            JOB_QUEUE.task_done()
+
+async def start_workers():
+    global vision_provider
+    vision_provider = _create_vision_provider()
+    try:
+        # Load the OCR model before the first job instead of inside it
+        await asyncio.to_thread(_warm_up_ocr)
+    except OCRFailure as e:
+        logger.error(f"OCR warm-up failed, will retry on first job: {e.message}")
+    worker_count = max(1, settings.PIPELINE_WORKERS)
+    for _ in range(worker_count):
+        _WORKERS.append(asyncio.create_task(process_loop()))
+    # Cancelled alongside the workers in stop_workers
+    _WORKERS.append(asyncio.create_task(job_store.heartbeat_loop()))
+    logger.info(f"Started {worker_count} pipeline workers (Provider: {settings.VISION_PROVIDER})")
+
+async def stop_workers():
+    for worker in _WORKERS:
+        worker.cancel()
+    await asyncio.gather(*_WORKERS, return_exceptions=True)
+    _WORKERS.clear()
+
+    # Jobs still queued will never run in this process; free them to be claimed again
+    while not JOB_QUEUE.empty():
+        job_id = JOB_QUEUE.get_nowait()
+        try:
+            await job_store.set(job_id, "failed: cancelled")
+            await job_store.release(job_id)
+        except Exception as e:
+            logger.error(f"Could not cancel queued job {job_id}: {e}")
+        finally:
+            JOB_QUEUE.task_done()
+
+def _write_text(path: str, text: str):
+    with open(path, "w") as f:
+        f.write(text)
+
+def _get_ocr_service() -> OCRService:
+    """Returns the shared OCR reader, loading it on first use. Call under _OCR_LOCK."""
+    global _ocr_service
+    if _ocr_service is None:
+        _ocr_service = OCRService()
+    return _ocr_service
+
+def _warm_up_ocr():
+    with _OCR_LOCK:
+        _get_ocr_service()
+
+def _preprocess_and_ocr(image, input_path: str, job_dir: str):
+    # 1. Preprocessing
+    logger.info(f"Step 1: Preprocessing {input_path}")
+    processed_image = ImagePreprocessor.preprocess(image, debug_output_dir=job_dir)
+
+    # 2. OCR (Optional dependency, might skip if vision is strong)
+    logger.info("Step 2: OCR Extraction")
+    # One reader per process and one OCR run at a time; concurrent EasyOCR
+    # inference multiplies memory and just competes for the same cores
+    with _OCR_LOCK:
+        ocr_results = _get_ocr_service().extract_text(processed_image)
+    logger.info(f"OCR found {len(ocr_results)} text items")
+    return ocr_results
 
 async def run_pipeline(job_id: str):
     logger.info(f"Starting pipeline for job {job_id}")
-    JOB_STATUS[job_id] = "processing"
-    
     try:
+        await job_store.set(job_id, "processing")
         job_dir = StorageService.get_job_dir(job_id)
-        # Find input file
-        input_files = glob.glob(os.path.join(job_dir, "*.*"))
-        # Exclude generated outputs
-        common_outputs = ["diagram.mmd", "diagram.png", "diagram.svg"]
-        input_path = next((f for f in input_files if os.path.basename(f) not in common_outputs and not os.path.basename(f).startswith("debug_")), None)
+        # Find input file, skipping generated outputs
+        with os.scandir(job_dir) as entries:
+            input_path = next((
+                e.path for e in entries
+                if e.is_file(follow_symlinks=False)
+                and e.name not in GENERATED_OUTPUTS
+                and not e.name.startswith(("debug_", "step_"))
+            ), None)
         
         if not input_path:
             raise FileNotFoundError("Input file not found")
 
-        # 1. Preprocessing
-        logger.info(f"Step 1: Preprocessing {input_path}")
         image = ImagePreprocessor.load_image(input_path)
-        processed_image = ImagePreprocessor.preprocess(image, debug_output_dir=job_dir)
-        
-        # 2. OCR (Optional dependency, might skip if vision is strong)
-        logger.info("Step 2: OCR Extraction")
-        ocr_service = OCRService() # Should be singleton in prod
-        ocr_results = ocr_service.extract_text(processed_image)
-        logger.info(f"OCR found {len(ocr_results)} text items")
 
-        # 3. Vision Analysis
+        # 3. Vision Analysis, overlapped with 1-2 (Preprocessing + OCR).
+        # Vision works on the original image and is network-bound while 1-2 are CPU-bound.
         logger.info(f"Step 3: Vision Analysis (Provider: {settings.VISION_PROVIDER})")
-        
-        vision_provider = None
-        if settings.VISION_PROVIDER == "openai":
-            from backend.app.services.vision.openai import OpenAIVisionProvider
-            vision_provider = OpenAIVisionProvider()
-        elif settings.VISION_PROVIDER == "gemini":
-            from backend.app.services.vision.gemini import GeminiVisionProvider
-            vision_provider = GeminiVisionProvider()
-        else:
-            from backend.app.services.vision.stub import StubVisionProvider
-            vision_provider = StubVisionProvider()
-
-        vision_data = await vision_provider.analyze(
+        vision_task = asyncio.create_task(vision_provider.analyze(
             image, 
             FLOWCHART_PROMPT,
-            status_callback=lambda status: JOB_STATUS.update({job_id: status})
-        )
+            status_callback=lambda status: job_store.set(job_id, status)
+        ))
+        ocr_task = asyncio.create_task(asyncio.to_thread(_preprocess_and_ocr, image, input_path, job_dir))
+        try:
+            ocr_results, vision_data = await asyncio.gather(ocr_task, vision_task)
+        except BaseException:
+            # Stops the vision coroutine; a to_thread call that already started
+            # cannot be interrupted, so OCR finishes in the background and is discarded
+            vision_task.cancel()
+            ocr_task.cancel()
+            raise
 
         # 4. Structure Inference
         logger.info("Step 4: Structure Inference")
@@ -74,8 +189,7 @@ async def run_pipeline(job_id: str):
         mermaid_code = MermaidGenerator.generate_code(diagram)
         
         mermaid_path = os.path.join(job_dir, "diagram.mmd")
-        with open(mermaid_path, "w") as f:
-            f.write(mermaid_code)
+        await asyncio.to_thread(_write_text, mermaid_path, mermaid_code)
 
         # 6. Rendering
         logger.info("Step 6: Rendering")
@@ -85,31 +199,39 @@ async def run_pipeline(job_id: str):
             # Move result to job dir if not already there (renderer returns path)
             final_png_path = os.path.join(job_dir, "diagram.png")
             if png_path != final_png_path:
-                import shutil
-                shutil.move(png_path, final_png_path)
+                await asyncio.to_thread(shutil.move, png_path, final_png_path)
         except Exception as e:
             logger.warning(f"Rendering failed (likely missing CLI): {e}")
             # Non-fatal if we just want the code
-            JOB_STATUS[job_id] = "completed_with_warnings" 
+            await job_store.set(job_id, "completed_with_warnings")
             return
 
-        JOB_STATUS[job_id] = "completed"
+        await job_store.set(job_id, "completed")
         logger.info(f"Job {job_id} completed successfully")
 
+    except asyncio.CancelledError:
+        # Worker shutdown; don't leave the job looking active
+        logger.warning(f"Job {job_id} cancelled")
+        try:
+            await job_store.set(job_id, "failed: cancelled")
+        except Exception as e:
+            logger.error(f"Could not record cancellation of job {job_id}: {e}")
+        raise
     except Exception as e:
         logger.error(f"Job {job_id} failed: {e}")
-        JOB_STATUS[job_id] = f"failed: {str(e)}"
+        await job_store.set(job_id, f"failed: {str(e)}")
 
 @router.post("/process/{job_id}")
-async def process_diagram(job_id: str, background_tasks: BackgroundTasks):
+async def process_diagram(job_id: str):
     """
     Trigger the processing pipeline for a given job ID.
     """
-    if job_id in JOB_STATUS and JOB_STATUS[job_id] in ["processing", "completed"]:
-        return {"message": "Job already exists", "job_id": job_id, "status": JOB_STATUS[job_id]}
+    # Atomic across workers; stale entries from a dead worker are re-claimed
+    status = await job_store.claim(job_id)
+    if status is not None:
+        return {"message": "Job already exists", "job_id": job_id, "status": status}
 
-    background_tasks.add_task(run_pipeline, job_id)
-    JOB_STATUS[job_id] = "queued"
+    await JOB_QUEUE.put(job_id)
     return {"message": "Processing started", "job_id": job_id}
 
 @router.get("/status/{job_id}")
@@ -117,5 +239,5 @@ async def get_status(job_id: str):
     """
     Get the status of a processing job.
     """
-    status = JOB_STATUS.get(job_id, "not_found")
+    status = await job_store.get(job_id) or "not_found"
     return {"status": status, "job_id": job_id}
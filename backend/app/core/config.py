@@ -30,6 +30,23 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: str = ""
     GEMINI_API_KEY: str = ""
 
+    # Vision result cache (content-addressed by image + prompt)
+    ENABLE_VISION_CACHE: bool = True
+    VISION_CACHE_DIR: str = "" # defaults to TEMP_DIR/vision_cache
+
+    # Vision API throttling (shared across all jobs in a process)
+    VISION_MAX_CONCURRENCY: int = 4
+    VISION_MAX_RPS: float = 1.0
+    VISION_MAX_IMAGE_EDGE: int = 1536 # longest edge sent to the API, 0 disables downscaling
+
+    # Pipeline
+    PIPELINE_WORKERS: int = 4
+
+    # Job status store (in-memory when unset)
+    REDIS_URL: str = "" # e.g. redis://localhost:6379/0
+    JOB_STATUS_TTL: int = 3600
+    JOB_LEASE_TTL: int = 30 # seconds before an unrefreshed active job counts as stale
+
     # Feature Toggles
     ENABLE_PREPROCESSING: bool = True
     ENABLE_OCR_FALLBACK: bool = False
@@ -55,17 +55,17 @@ class InferenceEngine:
                 # Sanitize label (basic cleanup before Mermaid generator handles the rest)
                 label = str(n_data.get("label", "Node"))
                 
-                nodes.append(Node(
+                # Fields are coerced here, so skip per-field validation
+                nodes.append(Node.model_construct(
                     id=new_id,
                     label=label,
-                    shape=n_data.get("shape", "rectangle"),
+                    shape=str(n_data.get("shape") or "rectangle"),
                     bbox=n_data.get("bbox")
                 ))
 
             # 2. Process Edges
-            edges = []
             raw_edges = vision_data.get("edges", [])
-            seen_edges = set()
+            edge_map = {} # (source, target) -> Edge, first occurrence wins
 
             for e_data in raw_edges:
                 src_orig = str(e_data.get("from"))
@@ -85,21 +85,23 @@ class InferenceEngine:
 
                 # Deduplicate edges
                 edge_key = (src_new, tgt_new)
-                if edge_key in seen_edges:
+                if edge_key in edge_map:
                     continue
-                seen_edges.add(edge_key)
 
-                edges.append(Edge(
+                edge_label = e_data.get("label")
+                edge_map[edge_key] = Edge.model_construct(
                     source=src_new,
                     target=tgt_new,
-                    label=e_data.get("label"),
-                    type=e_data.get("type", "arrow")
-                ))
+                    label=str(edge_label) if edge_label is not None else None,
+                    type=str(e_data.get("type") or "arrow")
+                )
+
+            edges = list(edge_map.values())
             
             logger.info(f"Graph built with {len(nodes)} nodes and {len(edges)} edges.")
             
-            return Diagram(
-                type=vision_data.get("diagram_type", "flowchart"),
+            return Diagram.model_construct(
+                type=str(vision_data.get("diagram_type") or "flowchart"),
                 nodes=nodes,
                 edges=edges
             )
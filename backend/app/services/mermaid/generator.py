@@ -1,30 +1,43 @@
 
-from typing import List
+from typing import Dict, Iterator, List
 from backend.app.services.inference import Diagram, Node, Edge
 from loguru import logger
 import re
+from functools import lru_cache
+
+# Single-char substitutions applied in one pass:
+# brackets/braces conflict with node shape syntax, quotes break string literals
+_LABEL_TRANS = str.maketrans({
+    '[': '(', ']': ')',
+    '{': '(', '}': ')',
+    '"': "'",
+    '\r': None,
+})
+
+@lru_cache(maxsize=512)
+def _sanitize_label(label: str) -> str:
+    """Sanitizes labels for Mermaid compatibility."""
+    if not label: 
+        return ""
+    label = label.translate(_LABEL_TRANS)
+    # Replace newlines with HTML break tags for Mermaid
+    # and special chars that might confuse HTML/XML parsers
+    return label.replace('\n', '<br/>').replace('&', 'and')
 
 class MermaidGenerator:
-    @staticmethod
-    def _sanitize_id(id_str: str) -> str:
+    _ID_RE = re.compile(r'[^a-zA-Z0-9]')
+    # Edges reference node IDs already sanitized at node emission; reset per diagram
+    _id_cache: Dict[str, str] = {}
+
+    @classmethod
+    def _sanitize_id(cls, id_str: str) -> str:
         """Sanitizes node IDs to be Mermaid-safe (alphanumeric)."""
-        return re.sub(r'[^a-zA-Z0-9]', '_', id_str)
+        id_clean = cls._id_cache.get(id_str)
+        if id_clean is None:
+            id_clean = cls._id_cache[id_str] = cls._ID_RE.sub('_', id_str)
+        return id_clean
 
-    @staticmethod
-    def _sanitize_label(label: str) -> str:
-        """Sanitizes labels for Mermaid compatibility."""
-        if not label: 
-            return ""
-        # Replace brackets/braces that conflict with node shape syntax
-        label = label.replace('[', '(').replace(']', ')')
-        label = label.replace('{', '(').replace('}', ')')
-        # Replace quotes to avoid string literal breaks
-        label = label.replace('"', "'")
-        # Replace newlines with HTML break tags for Mermaid
-        label = label.replace('\n', '<br/>').replace('\r', '')
-        # Replace special chars that might confuse HTML/XML parsers
-        label = label.replace('&', 'and')
-        return label
+    _sanitize_label = staticmethod(_sanitize_label)
 
     @staticmethod
     def _get_node_shape(id_clean: str, label: str, shape: str) -> str:
@@ -41,33 +54,37 @@ class MermaidGenerator:
         else: # Default rectangle
             return f'{id_clean}["{label}"]'
 
+    _ARROWS = {"dotted": "-.->", "thick": "==>"}
+
     @staticmethod
-    def generate_code(diagram: Diagram) -> str:
-        """
-        Converts a canonical Diagram object into Mermaid code.
-        """
-        lines = ["flowchart TD"]
+    def _emit(diagram: Diagram) -> Iterator[str]:
+        """Yields Mermaid code line by line."""
+        # Local aliases skip attribute lookups in the loops below
+        sanitize_id = MermaidGenerator._sanitize_id
+        sanitize_label = MermaidGenerator._sanitize_label
+        get_node_shape = MermaidGenerator._get_node_shape
+        arrows = MermaidGenerator._ARROWS
+
+        yield "flowchart TD"
 
         # 1. Add Nodes
         for node in diagram.nodes:
-            id_clean = MermaidGenerator._sanitize_id(node.id)
-            lines.append(f"    {MermaidGenerator._get_node_shape(id_clean, node.label, node.shape)}")
+            yield f"    {get_node_shape(sanitize_id(node.id), node.label, node.shape)}"
 
         # 2. Add Edges
         for edge in diagram.edges:
-            src = MermaidGenerator._sanitize_id(edge.source)
-            tgt = MermaidGenerator._sanitize_id(edge.target)
-            
-            arrow = "-->"
-            if edge.type == "dotted":
-                arrow = "-.->"
-            elif edge.type == "thick":
-                arrow = "==>"
-            
+            src = sanitize_id(edge.source)
+            tgt = sanitize_id(edge.target)
+            arrow = arrows.get(edge.type, "-->")
             if edge.label:
-                label_clean = MermaidGenerator._sanitize_label(edge.label)
-                lines.append(f"    {src} {arrow}|{label_clean}| {tgt}")
+                yield f"    {src} {arrow}|{sanitize_label(edge.label)}| {tgt}"
             else:
-                lines.append(f"    {src} {arrow} {tgt}")
+                yield f"    {src} {arrow} {tgt}"
 
-        return "\n".join(lines)
+    @staticmethod
+    def generate_code(diagram: Diagram) -> str:
+        """
+        Converts a canonical Diagram object into Mermaid code.
+        """
+        MermaidGenerator._id_cache.clear()
+        return "\n".join(MermaidGenerator._emit(diagram))
@@ -0,0 +1,153 @@
+
+import asyncio
+import uuid
+from typing import Dict, Optional, Set
+from redis import asyncio as aioredis
+from backend.app.core.config import settings
+from loguru import logger
+
+ACTIVE_STATUSES = frozenset({"queued", "processing", "processing_retrying"})
+
+def is_active_status(status: Optional[str]) -> bool:
+    """True for statuses of a job that is queued or still running."""
+    if not status:
+        return False
+    return status in ACTIVE_STATUSES or status.startswith("waiting_rate_limit_")
+
+# Refuses the claim if the job is completed, or active with a live lease.
+# Otherwise (terminal failure, or active but its owner died) takes it over.
+_TAKEOVER_SCRIPT = """
+local status = redis.call('GET', KEYS[1])
+if status == 'completed' then
+    return status
+end
+if status and redis.call('EXISTS', KEYS[2]) == 1 then
+    if status == 'queued' or status == 'processing' or status == 'processing_retrying'
+        or string.sub(status, 1, 19) == 'waiting_rate_limit_' then
+        return status
+    end
+end
+redis.call('SET', KEYS[1], 'queued', 'EX', ARGV[1])
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+return false
+"""
+
+# Lease operations only touch a lease this process still holds, so a worker
+# that lost its job to a takeover can't delete or overwrite the new owner's lease.
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Refreshes our own lease, or re-takes one that lapsed without a takeover
+# (a takeover always writes the new owner's lease). Returns 0 if lost.
+_REFRESH_SCRIPT = """
+local owner = redis.call('GET', KEYS[1])
+if owner == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+if not owner then
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+    return 1
+end
+return 0
+"""
+
+class JobStatusStore:
+    """
+    Job status store shared across workers.
+    Backed by Redis when REDIS_URL is set, otherwise falls back to an
+    in-process dict (single worker only, lost on restart).
+
+    A claimed job also holds a short-lived lease that the owning process keeps
+    refreshing. An active status without a lease belonged to a worker that
+    crashed or restarted, and can be claimed again.
+    """
+    KEY_PREFIX = "sketch2flow:job_status:"
+    LEASE_PREFIX = "sketch2flow:job_lease:"
+
+    def __init__(self, redis_url: str = settings.REDIS_URL):
+        self._redis = None
+        self._takeover = None
+        self._release = None
+        self._refresh = None
+        self._local: Dict[str, str] = {}
+        self._owned: Set[str] = set() # jobs queued or running in this process
+        self.owner_id = uuid.uuid4().hex
+        if redis_url:
+            self._redis = aioredis.from_url(redis_url, decode_responses=True)
+            self._takeover = self._redis.register_script(_TAKEOVER_SCRIPT)
+            self._release = self._redis.register_script(_RELEASE_SCRIPT)
+            self._refresh = self._redis.register_script(_REFRESH_SCRIPT)
+        else:
+            logger.warning("REDIS_URL not set. Job status is kept in memory (single worker only).")
+
+    async def get(self, job_id: str) -> Optional[str]:
+        if self._redis is None:
+            return self._local.get(job_id)
+        return await self._redis.get(self.KEY_PREFIX + job_id)
+
+    async def set(self, job_id: str, status: str, ttl: int = settings.JOB_STATUS_TTL):
+        if self._redis is None:
+            self._local[job_id] = status
+            return
+        await self._redis.set(self.KEY_PREFIX + job_id, status, ex=ttl)
+
+    async def claim(self, job_id: str, ttl: int = settings.JOB_STATUS_TTL) -> Optional[str]:
+        """
+        Atomically marks the job "queued" and takes its lease.
+        Returns None if claimed, otherwise the status of the existing job.
+        """
+        if self._redis is None:
+            status = self._local.get(job_id)
+            if status == "completed" or (is_active_status(status) and job_id in self._owned):
+                return status
+            self._local[job_id] = "queued"
+            self._owned.add(job_id)
+            return None
+
+        key = self.KEY_PREFIX + job_id
+        lease_key = self.LEASE_PREFIX + job_id
+        # Fast path: a job nobody has touched yet
+        if await self._redis.set(key, "queued", nx=True, ex=ttl):
+            await self._redis.set(lease_key, self.owner_id, ex=settings.JOB_LEASE_TTL)
+        else:
+            status = await self._takeover(keys=[key, lease_key], args=[ttl, self.owner_id, settings.JOB_LEASE_TTL])
+            if status is not None:
+                return status
+            logger.info(f"Re-claimed job {job_id}")
+        self._owned.add(job_id)
+        return None
+
+    async def release(self, job_id: str):
+        """Drops the lease once this process is done with the job."""
+        self._owned.discard(job_id)
+        if self._redis is not None:
+            await self._release(keys=[self.LEASE_PREFIX + job_id], args=[self.owner_id])
+
+    async def heartbeat_loop(self):
+        """Keeps the leases of jobs owned by this process alive."""
+        if self._redis is None:
+            return
+        interval = max(1, settings.JOB_LEASE_TTL // 3)
+        while True:
+            await asyncio.sleep(interval)
+            for job_id in list(self._owned):
+                try:
+                    held = await self._refresh(
+                        keys=[self.LEASE_PREFIX + job_id],
+                        args=[self.owner_id, settings.JOB_LEASE_TTL]
+                    )
+                except Exception as e:
+                    logger.warning(f"Failed to refresh lease for job {job_id}: {e}")
+                    continue
+                if not held:
+                    # Another worker took the job over; stop claiming it
+                    logger.warning(f"Lost lease for job {job_id} to another worker")
+                    self._owned.discard(job_id)
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.aclose()
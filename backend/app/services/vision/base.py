@@ -8,5 +8,6 @@ class VisionProvider(ABC):
     async def analyze(self, image: np.ndarray, prompt: str, status_callback=None) -> Dict[str, Any]:
         """
         Analyzes the image and returns a structured JSON.
+        `status_callback`, if given, is an async callable taking a status string.
         """
         pass
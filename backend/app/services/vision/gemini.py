@@ -1,8 +1,17 @@
 
+import asyncio
+import hashlib
+import io
 import json
-from typing import Dict, Any, Union
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple, Union
+import httpx
 import numpy as np
-import cv2
+import orjson
 from loguru import logger
 from google import genai
 from google.genai import types
@@ -11,51 +20,204 @@ from backend.app.core.errors import VisionFailure
 from backend.app.services.vision.base import VisionProvider
 from PIL import Image
 
+# Server-suggested backoff in rate-limit (429) error messages
+_RETRY_RE = re.compile(r"retry in (\d+(?:\.\d+)?)s")
+# First markdown-fenced block that contains a JSON object
+_FENCE_RE = re.compile(r"```(?:json)?\s*(\{.*?\})\s*```", re.DOTALL)
+
+class RateLimiter:
+    """Spaces out calls so at most `rate` requests start per second."""
+    def __init__(self, rate: float):
+        self.min_interval = 1.0 / rate if rate > 0 else 0.0
+        self.last_request_time = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            wait_time = self.last_request_time + self.min_interval - time.monotonic()
+            if wait_time > 0:
+                await asyncio.sleep(wait_time)
+            self.last_request_time = time.monotonic()
+
 class GeminiVisionProvider(VisionProvider):
+    JPEG_QUALITY = 90
+
+    # One client per process so every job reuses the same warm connection pool
+    _client: Optional[genai.Client] = None
+    _client_lock = threading.Lock()
+
+    @classmethod
+    def _get_client(cls) -> genai.Client:
+        if cls._client is None:
+            with cls._client_lock:
+                if cls._client is None:
+                    pool_size = max(1, settings.VISION_MAX_CONCURRENCY)
+                    cls._client = genai.Client(
+                        api_key=settings.GEMINI_API_KEY,
+                        http_options=types.HttpOptions(client_args={
+                            "http2": True,
+                            "limits": httpx.Limits(
+                                max_connections=pool_size * 2,
+                                max_keepalive_connections=pool_size,
+                            ),
+                        })
+                    )
+        return cls._client
+
     def __init__(self):
+        # Shared by every job using this instance, so keep one provider per process
+        self._semaphore = asyncio.Semaphore(max(1, settings.VISION_MAX_CONCURRENCY))
+        self._rate_limiter = RateLimiter(settings.VISION_MAX_RPS)
+
+        self.cache_dir = None
+        if settings.ENABLE_VISION_CACHE:
+            self.cache_dir = settings.VISION_CACHE_DIR or os.path.join(settings.TEMP_DIR, "vision_cache")
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+        self.model_name = "gemini-2.5-flash"
         if not settings.GEMINI_API_KEY:
             logger.warning("GEMINI_API_KEY not set. GeminiVisionProvider might fail.")
             return
-        
-        self.client = genai.Client(api_key=settings.GEMINI_API_KEY)
-        self.model_name = "gemini-2.5-flash"
+
+        self._get_client()
 
     def _convert_to_pil(self, image: np.ndarray) -> Image.Image:
         """Converts BGR numpy image to RGB PIL Image."""
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        return Image.fromarray(rgb_image)
+        if image.ndim == 2:
+            return Image.fromarray(image)
+        # PIL's raw decoder swaps channels while copying into the image,
+        # avoiding an intermediate RGB array
+        height, width = image.shape[:2]
+        return Image.frombuffer("RGB", (width, height), np.ascontiguousarray(image), "raw", "BGR", 0, 1)
+
+    def _encode_image(self, image: np.ndarray) -> bytes:
+        """Encodes BGR numpy image to JPEG bytes."""
+        pil_image = self._convert_to_pil(image)
+        max_edge = settings.VISION_MAX_IMAGE_EDGE
+        if max_edge > 0:
+            width, height = pil_image.size
+            scale = max_edge / max(width, height)
+            if scale < 1.0:
+                # Diagram structure survives moderate downscaling; upload size doesn't
+                pil_image = pil_image.resize(
+                    (max(1, int(width * scale)), max(1, int(height * scale))),
+                    Image.LANCZOS
+                )
+        buffer = io.BytesIO()
+        pil_image.save(buffer, format="JPEG", quality=self.JPEG_QUALITY)
+        return buffer.getvalue()
+
+    def _cache_key(self, image: np.ndarray, prompt: str) -> str:
+        """SHA-256 over model, encode parameters, image geometry, raw pixel bytes and prompt."""
+        digest = hashlib.sha256()
+        # Gemini sees the downscaled JPEG, so its parameters are part of the input
+        digest.update(
+            f"{self.model_name}:{settings.VISION_MAX_IMAGE_EDGE}:{self.JPEG_QUALITY}:"
+            f"{image.shape}:{image.dtype}".encode()
+        )
+        # Hash the pixel buffer in place (no copy for contiguous cv2 images)
+        digest.update(memoryview(np.ascontiguousarray(image)))
+        digest.update(prompt.encode())
+        return digest.hexdigest()
+
+    def _lookup_cache(self, image: np.ndarray, prompt: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """Returns the cache path for this request and its cached result, if any."""
+        cache_path = os.path.join(self.cache_dir, f"{self._cache_key(image, prompt)}.json")
+        return cache_path, self._read_cache(cache_path)
+
+    @staticmethod
+    def _read_cache(cache_path: str) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(cache_path):
+            return None
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable vision cache entry {cache_path}: {e}")
+            return None
+
+    def _write_cache(self, cache_path: str, data: Dict[str, Any]):
+        # Write to a unique temp file first so readers never see a partial entry
+        # and concurrent misses on the same image don't clobber each other
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Could not write vision cache entry {cache_path}: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @staticmethod
+    async def _report_status(status_callback, status: str):
+        """Best-effort progress update; a lost update must not fail the vision call."""
+        if not status_callback:
+            return
+        try:
+            await status_callback(status)
+        except Exception as e:
+            logger.warning(f"Failed to report status '{status}': {e}")
 
     async def analyze(self, image: np.ndarray, prompt: str, status_callback=None) -> Dict[str, Any]:
+        cache_path = None
+        if self.cache_dir:
+            # Hashing a full-resolution frame is CPU-heavy, keep it off the event loop
+            cache_path, cached = await asyncio.to_thread(self._lookup_cache, image, prompt)
+            if cached is not None:
+                logger.info("Vision cache hit, skipping Gemini API call")
+                return cached
+
         logger.info(f"Sending image to Gemini Vision API ({self.model_name})...")
-        pil_image = self._convert_to_pil(image)
+        # Encode once; the same bytes are reused across rate-limit retries
+        jpeg_bytes = await asyncio.to_thread(self._encode_image, image)
+        image_part = types.Part.from_bytes(data=jpeg_bytes, mime_type="image/jpeg")
 
         retry_count = 0
         max_retries = 3
         
         while retry_count <= max_retries:
             try:
-                # The prompt structure for multimodal in the new SDK:
-                response = self.client.models.generate_content(
-                    model=self.model_name,
-                    contents=[
-                        prompt,
-                        pil_image
-                    ],
-                    config=types.GenerateContentConfig(
-                        response_mime_type="application/json"
+                async with self._semaphore:
+                    await self._rate_limiter.acquire()
+                    # The SDK call is blocking, run it off the event loop.
+                    # The prompt structure for multimodal in the new SDK:
+                    response = await asyncio.to_thread(
+                        self._get_client().models.generate_content,
+                        model=self.model_name,
+                        contents=[
+                            prompt,
+                            image_part
+                        ],
+                        config=types.GenerateContentConfig(
+                            response_mime_type="application/json"
+                        )
                     )
-                )
                 
                 content = response.text
                 if not content:
                      raise VisionFailure("Gemini returned empty response")
     
-                # Clean content (remove markdown fences)
-                cleaned_content = self._clean_json(content)
                 logger.debug(f"Raw Gemini response: {content}")
-                logger.debug(f"Cleaned Gemini response: {cleaned_content}")
-    
-                return json.loads(cleaned_content)
+                result = None
+                try:
+                    # response_mime_type is JSON, so the raw text usually parses as-is.
+                    # JSON mode may still wrap the object (e.g. `[{...}]`), so only a
+                    # top-level object takes the fast path.
+                    parsed = orjson.loads(content)
+                    if isinstance(parsed, dict):
+                        result = parsed
+                except orjson.JSONDecodeError:
+                    pass
+                if result is None:
+                    # Clean content (remove markdown fences, extract first object)
+                    cleaned_content = self._clean_json(content)
+                    logger.debug(f"Cleaned Gemini response: {cleaned_content}")
+                    result = orjson.loads(cleaned_content)
+                if cache_path and isinstance(result, dict):
+                    await asyncio.to_thread(self._write_cache, cache_path, result)
+                return result
     
             except Exception as e:
                 error_str = str(e)
@@ -66,15 +228,11 @@ class GeminiVisionProvider(VisionProvider):
                         logger.error(f"Gemini Vision API Rate Limit Exceeded after {max_retries} retries: {e}")
                         raise VisionFailure(f"Rate limit exceeded (429). Please wait a minute and try again. Details: {e}")
                     
-                    import time
-                    import re
-                    import asyncio
-                    
                     # Try to parse 'retry in X s' from error message
                     # Example: "Please retry in 47.142904658s."
                     wait_time = 5 * (2 ** (retry_count - 1)) # Default exponential backoff: 5, 10, 20
                     
-                    match = re.search(r"retry in (\d+(\.\d+)?)s", error_str)
+                    match = _RETRY_RE.search(error_str)
                     if match:
                         try:
                             parsed_wait = float(match.group(1))
@@ -84,15 +242,13 @@ class GeminiVisionProvider(VisionProvider):
                             
                     logger.warning(f"Rate limit hit. Waiting {wait_time:.2f}s before retry {retry_count}/{max_retries}...")
                     
-                    if status_callback:
-                        status_callback(f"waiting_rate_limit_{int(wait_time)}s")
+                    await self._report_status(status_callback, f"waiting_rate_limit_{int(wait_time)}s")
                     
                     # Use asyncio.sleep instead of time.sleep to not block the event loop
                     await asyncio.sleep(wait_time)
                     
                     # Reset status to processing before retrying
-                    if status_callback:
-                        status_callback("processing_retrying")
+                    await self._report_status(status_callback, "processing_retrying")
                         
                     continue
                 
@@ -110,23 +266,16 @@ class GeminiVisionProvider(VisionProvider):
         text = text.strip()
         
         # Remove potential markdown wrappers first
-        if "```" in text:
-            # simple split to find content between fences if they exist
-            # This handles ```json ... ``` or just ``` ... ```
-            parts = text.split("```")
-            for part in parts:
-                if "{" in part:
-                    # Found a candidate block, let's clean it up
-                    candidate = part.strip()
-                    if candidate.startswith("json"):
-                        candidate = candidate[4:].strip()
-                    text = candidate
-                    break
+        # This handles ```json ... ``` or just ``` ... ```
+        match = _FENCE_RE.search(text)
+        if match:
+            return match.group(1)
         
+        # Unfenced or malformed text: fall back to the stack scan
         # Finidng the first '{'
         start_idx = text.find("{")
         if start_idx == -1:
-            return text # Let json.loads fail naturally or return empty
+            return text # Let orjson.loads fail naturally or return empty
             
         # Stack counter
         balance = 0
@@ -1,4 +1,5 @@
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from backend.app.core.config import settings
@@ -7,9 +8,17 @@ from backend.app.api.endpoints import upload, process, results
 
 setup_logging()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await process.start_workers()
+    yield
+    await process.stop_workers()
+    await process.job_store.close()
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan
 )
 
 # Set all CORS enabled origins
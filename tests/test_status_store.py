@@ -0,0 +1,67 @@
+import asyncio
+import os
+import sys
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.app.services.status import JobStatusStore, is_active_status
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_is_active_status():
+    for status in ["queued", "processing", "processing_retrying", "waiting_rate_limit_48s"]:
+        assert is_active_status(status)
+    for status in [None, "", "completed", "completed_with_warnings", "failed: boom", "failed: cancelled"]:
+        assert not is_active_status(status)
+
+
+def test_duplicate_claim_is_refused():
+    async def scenario():
+        store = JobStatusStore(redis_url="")
+        assert await store.claim("job") is None
+        assert await store.get("job") == "queued"
+        # Second POST while queued / running / retrying a rate limit
+        assert await store.claim("job") == "queued"
+        await store.set("job", "processing")
+        assert await store.claim("job") == "processing"
+        await store.set("job", "waiting_rate_limit_10s")
+        assert await store.claim("job") == "waiting_rate_limit_10s"
+
+    run(scenario())
+
+
+def test_reclaim_after_failure():
+    async def scenario():
+        store = JobStatusStore(redis_url="")
+        assert await store.claim("job") is None
+        await store.set("job", "failed: Input file not found")
+        assert await store.claim("job") is None
+        assert await store.get("job") == "queued"
+
+    run(scenario())
+
+
+def test_reclaim_after_release():
+    async def scenario():
+        store = JobStatusStore(redis_url="")
+        assert await store.claim("job") is None
+        # Job left "queued" but no longer owned, e.g. dropped from the queue
+        await store.release("job")
+        assert await store.claim("job") is None
+
+    run(scenario())
+
+
+def test_completed_job_is_not_reclaimed():
+    async def scenario():
+        store = JobStatusStore(redis_url="")
+        assert await store.claim("job") is None
+        await store.set("job", "completed")
+        await store.release("job")
+        assert await store.claim("job") == "completed"
+
+    run(scenario())